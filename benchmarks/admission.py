@@ -0,0 +1,83 @@
+# Admission control under a spike: one noisy client floods /api/chat while a few polite clients search now and then
+# and a reader keeps calling the local-only /api/reader_format, with admission control off and on.
+#   python benchmarks/admission.py --mode sync --workers 4 --seconds 20
+# Clients are told apart by X-Forwarded-For (ADMISSION_PROXY_HOPS=1), as they would be behind a proxy.
+import argparse
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_upstream import make_server
+from throughput import start_app
+
+
+def client_loop(base_url, send, forwarded_for, stop, results, pause=0.0):
+    session = requests.Session()
+    session.headers["X-Forwarded-For"] = forwarded_for
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status = send(session, base_url, f"{forwarded_for}-{i}")
+        except requests.RequestException:
+            status = 0
+        results.append((status, time.perf_counter() - start))
+        i += 1
+        if pause: stop.wait(pause)
+
+
+GROUPS = {
+    # group -> (number of clients, send, pause between requests)
+    "noisy chat": (16, lambda s, url, tag: s.post(f"{url}/api/chat", json={"message": f"question {tag}?"}, timeout=120).status_code, 0.0),
+    "polite search": (4, lambda s, url, tag: s.post(f"{url}/api/search", json={"term": f"word{tag}", "language": "English"}, timeout=120).status_code, 1.0),
+    "reader": (1, lambda s, url, tag: s.post(f"{url}/api/reader_format", json={"text": "A short paragraph to format. " * 20, "compact": True}, timeout=120).status_code, 0.1),
+}
+
+
+def summarise(results):
+    ok = sorted(latency for status, latency in results if status == 200)
+    pct = lambda q: ok[min(len(ok) - 1, int(q * len(ok)))] if ok else float("nan")
+    count = lambda code: sum(1 for status, _ in results if status == code)
+    return len(results), len(ok), count(503), count(429), pct(0.5), pct(0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="sync")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    stub = make_server(0, args.llm_latency, 0.2)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    print(f"{args.mode} mode, {args.workers} workers, {args.seconds:.0f}s, stub LLM {args.llm_latency}s\n")
+    print("| admission | group | requests | ok | 503 | 429 | p50 ok (s) | p95 ok (s) |")
+    print("|-----------|-------|---------:|---:|----:|----:|-----------:|-----------:|")
+    for admission in ("0", "1"):
+        proc, base_url = start_app(args.mode, args.workers, stub.server_port, {"ADMISSION_CONTROL": admission, "ADMISSION_PROXY_HOPS": "1"})
+        try:
+            stop, threads, results = threading.Event(), [], {name: [] for name in GROUPS}
+            for group, (clients, send, pause) in GROUPS.items():
+                for n in range(clients):
+                    # The noisy client is one address with many connections; polite clients each have their own
+                    forwarded_for = "10.0.0.1" if group == "noisy chat" else f"10.0.{list(GROUPS).index(group)}.{n}"
+                    threads.append(threading.Thread(target=client_loop, args=(base_url, send, forwarded_for, stop, results[group], pause)))
+            for t in threads: t.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for t in threads: t.join()
+            for group, group_results in results.items():
+                total, ok, shed, limited, p50, p95 = summarise(group_results)
+                print(f"| {'on' if admission == '1' else 'off'} | {group} | {total} | {ok} | {shed} | {limited} | {p50:.2f} | {p95:.2f} |", flush=True)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# WSGI entry point for load tests: the real app, with its TTS engines and speech recognizer calling the stub
+# upstream's /tts and /stt instead of Microsoft's, Google's and OpenAI's services. load.py starts it as
+#   STUB_URL=http://127.0.0.1:8900 gunicorn --pythonpath benchmarks bench_app:app
+import asyncio
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as dictionary_app
+from app import app  # noqa: F401  (the WSGI callable gunicorn loads)
+
+STUB_URL = os.environ["STUB_URL"]
+
+
+def stub_tts(text):
+    response = requests.post(f"{STUB_URL}/tts", json={"text": text}, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+
+async def stub_edge_chunks(text, voice):
+    yield await asyncio.get_running_loop().run_in_executor(None, stub_tts, text)
+
+
+def stub_gtts(text, lang='en'):
+    try:
+        return stub_tts(text)
+    except Exception as e:
+        print(f"gTTS Error: {e}")
+        return None
+
+
+def stub_recognize(pcm, sample_rate, language):
+    response = requests.post(f"{STUB_URL}/stt", data=pcm, timeout=60)
+    if response.status_code >= 500: raise dictionary_app.TranscriptionServiceError(f"stub returned {response.status_code}")
+    return response.json()["text"]
+
+
+dictionary_app._edge_tts_chunks = stub_edge_chunks
+dictionary_app.generate_gtts_audio = stub_gtts
+dictionary_app.register_transcriber("stub", stub_recognize)
+dictionary_app.TRANSCRIBE_BACKEND = "stub"
@@ -0,0 +1,76 @@
+# Measures what `import app` costs and what each lazily loaded engine costs on first use, each in a fresh interpreter.
+#   python benchmarks/import_cost.py            # report
+#   python benchmarks/import_cost.py --check    # exit 1 if import_budget.json is exceeded (run in CI before deploys)
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+
+def run_python(code, *flags):
+    env = dict(os.environ, CACHE_DIR=tempfile.mkdtemp(prefix="import-cost-"))
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def import_profile():
+    # -X importtime lines: "import time: self | cumulative | <indent>module"; indent 1 means imported directly
+    result = run_python("import app; print(app.APP_IMPORT_SECONDS)", "-X", "importtime")
+    modules, top_level = set(), {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$", line)
+        if not match: continue
+        name, depth = match.group(4), (len(match.group(3)) - 1) // 2
+        modules.add(name)
+        if depth == 1: top_level[name] = int(match.group(2)) / 1e6
+    return float(result.stdout.strip().splitlines()[-1]), top_level, modules
+
+
+def engine_profile():
+    result = run_python("import json, app; print(json.dumps(app.warm_engines(list(app.ENGINE_LOADERS))))")
+    return json.loads(result.stdout.strip().splitlines()[-1])["engines"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    with open(BUDGET_PATH) as f:
+        budget = json.load(f)
+
+    import_seconds, top_level, modules = import_profile()
+    print(f"import app: {import_seconds:.3f}s\n")
+    print("| module (imported by app) | cumulative (s) |")
+    print("|--------------------------|---------------:|")
+    for name, seconds in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"| {name} | {seconds:.3f} |")
+
+    engines = engine_profile()
+    print("\n| engine (first use) | load (s) |")
+    print("|--------------------|---------:|")
+    for name, timing in engines.items():
+        print(f"| {name} | {timing['seconds']:.3f} |")
+
+    if args.check:
+        failures = []
+        if import_seconds > budget["max_import_seconds"]:
+            failures.append(f"import app took {import_seconds:.3f}s, budget {budget['max_import_seconds']}s")
+        for name in budget["lazy_modules"]:
+            if name in modules: failures.append(f"{name} is imported eagerly; load it with load_module() on first use")
+        for name, limit in budget["max_engine_seconds"].items():
+            if name in engines and engines[name]["seconds"] > limit:
+                failures.append(f"{name} took {engines[name]['seconds']:.3f}s to load, budget {limit}s")
+        print()
+        for failure in failures: print(f"FAIL: {failure}")
+        if failures: sys.exit(1)
+        print("OK: within import budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# Load scenarios for every expensive endpoint against the stub upstream, across serving modes, worker counts and
+# client concurrency.
+#   python benchmarks/load.py --scenarios search,tts --modes sync,async --workers 2,4 --concurrency 10,50 --failure-rate 0.05
+# Each (mode, workers) pair gets a fresh gunicorn and cache directory; scenarios then run back to back against it.
+import argparse
+import io
+import itertools
+import os
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_upstream import make_server
+from throughput import start_app
+
+
+def wav_bytes(seconds, rate=16000):
+    # Alternating 4s tone / 0.8s pause, so the transcription pipeline has pauses to split on
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        voiced = (i % int(4.8 * rate)) < 4 * rate
+        frames += int(8000 * voiced * (1 if (i // 36) % 2 else -1)).to_bytes(2, "little", signed=True)
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1); w.setsampwidth(2); w.setframerate(rate)
+        w.writeframes(bytes(frames))
+    return out.getvalue()
+
+
+READER_TEXT = " ".join(f"Reader sentence {i} walks through a quiet library, turning pages slowly." for i in range(500))
+CLIP = wav_bytes(30)
+
+# name -> send(session, base_url, i, tag) -> status code. Terms and texts are unique per request so each one misses
+# the caches and exercises the upstream path; wotd and reader_format are cache-independent.
+SCENARIOS = {
+    "search": lambda s, url, i, tag: s.post(f"{url}/api/search", json={"term": f"{tag}word{i}", "language": "English"}, timeout=300).status_code,
+    "wotd": lambda s, url, i, tag: s.get(f"{url}/api/wotd", params={"language": "English"}, timeout=300).status_code,
+    "chat": lambda s, url, i, tag: s.post(f"{url}/api/chat", json={"message": f"{tag} question {i}?"}, timeout=300).status_code,
+    "tts": lambda s, url, i, tag: s.post(f"{url}/api/tts", json={"text": f"This is spoken sentence {tag} {i}."}, timeout=300).status_code,
+    "transcribe": lambda s, url, i, tag: s.post(f"{url}/api/transcribe", files={"file": ("clip.wav", CLIP, "audio/wav")}, timeout=300).status_code,
+    "reader_format": lambda s, url, i, tag: s.post(f"{url}/api/reader_format", json={"text": READER_TEXT, "compact": True}, timeout=300).status_code,
+}
+
+
+def run_scenario(send, base_url, total, concurrency, tag):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        nonlocal errors
+        session = getattr(local, "session", None) or setattr(local, "session", requests.Session()) or local.session
+        start = time.perf_counter()
+        try:
+            ok = send(session, base_url, i, tag) == 200
+        except requests.RequestException:
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            if not ok: errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"elapsed": elapsed, "rps": total / elapsed, "p50": latencies[len(latencies) // 2], "p95": latencies[max(int(len(latencies) * 0.95) - 1, 0)], "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--workers", default="2")
+    parser.add_argument("--concurrency", default="10,50")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--image-latency", type=float, default=0.2)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--stt-latency", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = make_server(0, args.llm_latency, args.image_latency, args.tts_latency, args.stt_latency, args.failure_rate)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+    print(f"{args.requests} requests per row; stub LLM {args.llm_latency}s, images {args.image_latency}s, TTS {args.tts_latency}s, "
+          f"STT {args.stt_latency}s per segment, failure rate {args.failure_rate:.0%}\n")
+    print("| mode | workers | scenario | concurrency | req/s | p50 (s) | p95 (s) | errors |")
+    print("|------|--------:|----------|------------:|------:|--------:|--------:|-------:|")
+    for mode, workers in itertools.product(args.modes.split(","), [int(w) for w in args.workers.split(",")]):
+        proc, base_url = start_app(mode, workers, stub.server_port, {"STUB_URL": stub_url}, target="bench_app:app")
+        try:
+            for name, concurrency in itertools.product(args.scenarios.split(","), [int(c) for c in args.concurrency.split(",")]):
+                r = run_scenario(SCENARIOS[name], base_url, args.requests, concurrency, f"{mode}{workers}c{concurrency}")
+                print(f"| {mode} | {workers} | {name} | {concurrency} | {r['rps']:.1f} | {r['p50']:.2f} | {r['p95']:.2f} | {r['errors']} |", flush=True)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Micro-benchmarks for the pure-Python rendering hot paths, with stored baselines and a regression gate.
+#   python benchmarks/micro.py            # report against micro_baselines.json
+#   python benchmarks/micro.py --check    # exit 1 if any benchmark is slower than baseline * (1 + tolerance)
+#   python benchmarks/micro.py --update   # re-record the baselines on this machine
+# Times are normalised by a fixed pure-Python calibration loop, so baselines recorded on one machine still gate
+# another: a machine twice as slow runs the calibration loop twice as slowly too.
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from app import build_concept_graph, generate_word_card_html, process_interactive_text
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baselines.json")
+
+WORD = {
+    "word": "serendipity", "language": "English", "pronunciation": "/ˌsɛr.ənˈdɪp.ɪ.ti/", "part_of_speech": "noun",
+    "definition": "The occurrence and development of events by chance in a happy or beneficial way, as when a search for one thing turns up another.",
+    "example": "A fortunate stroke of serendipity brought the two old friends together in a café neither had visited before.",
+    "etymology": "Coined by Horace Walpole in 1754 after The Three Princes of Serendip, a Persian fairy tale whose heroes kept making discoveries by accident.",
+    "synonyms": ["chance", "fluke", "luck", "fortuity", "happenstance", "providence", "coincidence", "windfall"],
+    "antonyms": ["misfortune", "design", "intention", "plan"],
+    "related_words": [{"word": w, "sentence": f"The {w} of the moment surprised everyone in the room that evening."} for w in ["discovery", "accident", "fortune", "destiny", "kismet", "karma"]],
+}
+IMAGES = [{"src": {size: f"https://images.example.com/photo-{i}-{size}.jpeg" for size in ("medium", "large")}} for i in range(4)]
+PARAGRAPH = " ".join([WORD["definition"], WORD["example"], WORD["etymology"]] * 20)
+
+BENCHMARKS = {
+    "generate_word_card_html": lambda: generate_word_card_html(WORD, IMAGES),
+    "process_interactive_text": lambda: process_interactive_text(PARAGRAPH),
+    "process_interactive_text_compact": lambda: process_interactive_text(PARAGRAPH, compact=True),
+    "build_concept_graph": lambda: build_concept_graph(WORD, "dark"),
+}
+
+
+def calibration():
+    total = 0
+    for i in range(200000): total += i % 7
+    return total
+
+
+def normalised_time(fn, repeat):
+    # Calibration and benchmark run back to back in every round, so a noisy neighbour slows both; the best round wins
+    calibration_timer, timer = timeit.Timer(calibration), timeit.Timer(fn)
+    number, _ = timer.autorange()
+    rounds = []
+    for _ in range(repeat):
+        unit = calibration_timer.timeit(1)
+        seconds = timer.timeit(number) / number
+        rounds.append((seconds / unit, seconds))
+    return min(rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update", action="store_true")
+    parser.add_argument("--repeat", type=int, default=15)
+    args = parser.parse_args()
+    with open(BASELINES_PATH) as f:
+        baselines = json.load(f)
+
+    results = {name: normalised_time(fn, args.repeat) for name, fn in BENCHMARKS.items()}
+    print("| benchmark | time (µs) | normalised | baseline | change |")
+    print("|-----------|----------:|-----------:|---------:|-------:|")
+    failures = []
+    for name, (normalised, seconds) in results.items():
+        baseline = baselines["normalised"].get(name)
+        change = f"{(normalised / baseline - 1) * 100:+.0f}%" if baseline else "new"
+        print(f"| {name} | {seconds * 1e6:.1f} | {normalised:.5f} | {baseline or 0:.5f} | {change} |")
+        if baseline and normalised > baseline * (1 + baselines["tolerance"]):
+            failures.append(f"{name} is {change} against its baseline (tolerance {baselines['tolerance']:.0%})")
+
+    if args.update:
+        baselines["normalised"] = {name: round(normalised, 5) for name, (normalised, _) in results.items()}
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print("\nbaselines updated")
+    elif args.check:
+        print()
+        for failure in failures: print(f"FAIL: {failure}")
+        if failures: sys.exit(1)
+        print("OK: within baseline tolerance")
+
+
+if __name__ == "__main__":
+    main()
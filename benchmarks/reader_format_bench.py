@@ -0,0 +1,84 @@
+# Tokenizer throughput and markup size for reader mode on a long document (default 100k words).
+#   python benchmarks/reader_format_bench.py --words 100000 --repeat 5
+# "before" is the per-token re.match/re.sub implementation that process_interactive_text replaced.
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from app import WORDFREQ_AVAILABLE, WOTD_LIST, iter_interactive_text, process_interactive_text
+
+
+def before_process_interactive_text(text):
+    if not text: return ""
+    parts = re.split(r'(\s+)', text)
+    html_parts = []
+    for p in parts:
+        if re.match(r'^\s+$', p):
+            html_parts.append(p)
+        else:
+            clean = re.sub(r'[.,\/#!$%\^&\*;:{}=\-_`~()?"\']', "", p)
+            if clean:
+                html_parts.append(f'<span class="cursor-pointer hover:bg-orange-100 dark:hover:bg-orange-900/50 rounded transition-colors" onclick="defineWord(\'{clean}\')">{p}</span>')
+            else:
+                html_parts.append(p)
+    return "".join(html_parts)
+
+
+def make_text(words, seed=7):
+    # Zipf-ish prose: frequent words repeat the way they do in a real chapter
+    rng = random.Random(seed)
+    if WORDFREQ_AVAILABLE:
+        from wordfreq import top_n_list
+        vocab = top_n_list('en', 20000)
+    else:
+        vocab = [w.lower() for w in WOTD_LIST]
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    tokens = rng.choices(vocab, weights=weights, k=words)
+    out = []
+    for i, token in enumerate(tokens):
+        if i % 14 == 0: token = token.capitalize()
+        if i % 14 == 13: token += rng.choice(".,;?!")
+        out.append(token)
+        out.append("\n\n" if i % 180 == 179 else " ")
+    return "".join(out)
+
+
+def measure(fn, text, repeat):
+    best, html = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html = fn(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(html.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_text(args.words)
+    assert process_interactive_text(text) == before_process_interactive_text(text), "default markup changed"
+    variants = [
+        ("before", before_process_interactive_text),
+        ("single-pass", process_interactive_text),
+        ("single-pass compact", lambda t: process_interactive_text(t, compact=True)),
+        ("streamed compact (64 KB chunks)", lambda t: "".join(iter_interactive_text(t, compact=True))),
+    ]
+    print(f"{args.words} words, {len(text.encode()) / 1e6:.2f} MB of input, best of {args.repeat}\n")
+    print("| variant | time (ms) | words/s | markup (MB) |")
+    print("|---------|----------:|--------:|------------:|")
+    for name, fn in variants:
+        elapsed, size = measure(fn, text, args.repeat)
+        print(f"| {name} | {elapsed * 1000:.0f} | {args.words / elapsed / 1e6:.2f}M | {size / 1e6:.2f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Local stand-in for OpenRouter, Pexels and the speech services so the app can be load-tested without live API calls.
+#   python benchmarks/stub_upstream.py --port 8900 --llm-latency 1.0 --image-latency 0.2 --failure-rate 0.05
+# then point the app at it:
+#   OPENROUTER_URL=http://127.0.0.1:8900/v1/chat/completions PEXELS_SEARCH_URL=http://127.0.0.1:8900/v1/search
+# POST /tts and POST /stt stand in for the TTS engines and the speech recognizer; bench_app.py wires them in.
+import argparse
+import json
+import random
+import re
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def fake_entry(word, language="English"):
+    return {
+        "word": word, "translated_word": word, "sentence_translation": None, "pronunciation": f"/{word}/",
+        "definition": f"A stub definition of {word}.", "translated_definition": f"A stub definition of {word}.",
+        "example": f"This sentence uses {word} as an example.", "etymology": f"From stub-{word}.",
+        "related_words": [{"word": f"{word}-like", "sentence": f"Something {word}-like happened."}],
+        "synonyms": [f"{word}-syn-1", f"{word}-syn-2"], "antonyms": [f"{word}-ant"], "language": language,
+    }
+
+
+def fake_completion(messages):
+    prompt = messages[-1]["content"] if messages else ""
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    match = re.match(r"Define:\s*(.*)", prompt, re.DOTALL)
+    if match:
+        language = (re.search(r'Target Language: "([^"]+)"', system) or [None, "English"])[1]
+        words = [w.strip() for w in match.group(1).split(",") if w.strip()]
+        return json.dumps({"results": [fake_entry(w, language) for w in words]})
+    return f"Stub reply to: {prompt[:80]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    llm_latency = 1.0
+    image_latency = 0.2
+    tts_latency = 0.3
+    stt_latency = 0.5
+    failure_rate = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, content, chunk_size=24):
+        # OpenAI-style SSE: the first delta after a short think time, the rest spread over llm_latency
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        time.sleep(self.llm_latency * 0.2)
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.llm_latency * 0.8 / max(len(chunks), 1))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _should_fail(self, latency):
+        # Failures still cost (part of) a round trip, like a real overloaded upstream
+        if random.random() >= self.failure_rate: return False
+        time.sleep(latency * random.random())
+        self._send_json({"error": "stub failure"}, status=503)
+        return True
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = urlparse(self.path).path
+        if path == "/tts":
+            if self._should_fail(self.tts_latency): return
+            text = json.loads(raw or b"{}").get("text", "")
+            time.sleep(self.tts_latency)
+            # Roughly the size of a 24 kbps mp3 of the text read aloud
+            audio = b"ID3" + bytes(200 * max(len(text), 1))
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(audio)))
+            self.end_headers()
+            self.wfile.write(audio)
+            return
+        if path == "/stt":
+            if self._should_fail(self.stt_latency): return
+            time.sleep(self.stt_latency)
+            return self._send_json({"text": f"stub transcript of {len(raw) // 32000:.0f} seconds"})
+        if self._should_fail(self.llm_latency): return
+        body = json.loads(raw or b"{}")
+        content = fake_completion(body.get("messages", []))
+        if body.get("stream"):
+            return self._send_stream(content)
+        time.sleep(self.llm_latency)
+        self._send_json({"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    def do_GET(self):
+        if self._should_fail(self.image_latency): return
+        query = parse_qs(urlparse(self.path).query).get("query", ["x"])[0]
+        time.sleep(self.image_latency)
+        photos = [{"src": {"medium": f"https://example.invalid/{query}/{i}-m.jpg", "large": f"https://example.invalid/{query}/{i}-l.jpg", "tiny": f"https://example.invalid/{query}/{i}-t.jpg"}} for i in range(4)]
+        self._send_json({"photos": photos})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def make_server(port=0, llm_latency=1.0, image_latency=0.2, tts_latency=0.3, stt_latency=0.5, failure_rate=0.0):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"llm_latency": llm_latency, "image_latency": image_latency, "tts_latency": tts_latency,
+                                                              "stt_latency": stt_latency, "failure_rate": failure_rate})
+    return StubServer(("127.0.0.1", port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--image-latency", type=float, default=0.2)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--stt-latency", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = make_server(args.port, args.llm_latency, args.image_latency, args.tts_latency, args.stt_latency, args.failure_rate)
+    print(f"Stub upstream listening on http://127.0.0.1:{server.server_port}")
+    server.serve_forever()
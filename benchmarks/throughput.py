@@ -0,0 +1,97 @@
+# Compares the sync and async (gevent) serving modes on /api/search against the local stub upstream.
+#   python benchmarks/throughput.py --requests 200 --concurrency 100 --workers 2
+# Every request uses a distinct term, so each one is a lookup-cache miss that waits on the stub LLM.
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_upstream import make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(mode, workers, stub_port, extra_env=None, target="app:app"):
+    port = free_port()
+    # Admission control is off unless asked for: every benchmark client shares one address and would be rate limited
+    env = dict(os.environ, SERVING_MODE=mode, CACHE_DIR=tempfile.mkdtemp(prefix="bench-cache-"), OPENAI_API_KEY="bench", ADMISSION_CONTROL="0",
+               OPENROUTER_URL=f"http://127.0.0.1:{stub_port}/v1/chat/completions", PEXELS_SEARCH_URL=f"http://127.0.0.1:{stub_port}/v1/search")
+    env.update(extra_env or {})
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", target, "--pythonpath", os.path.join(ROOT, "benchmarks"), "--workers", str(workers),
+                             "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/stats", timeout=1)
+            return proc, f"http://127.0.0.1:{port}"
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"gunicorn ({mode}) did not start")
+
+
+def run_load(base_url, total, concurrency, tag):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = requests.post(f"{base_url}/api/search", json={"term": f"{tag}word{i}", "language": "English"}, timeout=300).status_code == 200
+        except requests.RequestException:
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            if not ok: errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"elapsed": elapsed, "rps": total / elapsed, "p50": latencies[len(latencies) // 2], "p95": latencies[int(len(latencies) * 0.95) - 1], "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--image-latency", type=float, default=0.2)
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    stub = make_server(0, args.llm_latency, args.image_latency)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    print(f"{args.requests} searches, {args.concurrency} concurrent clients, {args.workers} workers, stub LLM {args.llm_latency}s / images {args.image_latency}s\n")
+    print("| mode | req/s | p50 (s) | p95 (s) | wall (s) | errors |")
+    print("|------|------:|--------:|--------:|---------:|-------:|")
+    for mode in args.modes.split(","):
+        proc, base_url = start_app(mode, args.workers, stub.server_port)
+        try:
+            r = run_load(base_url, args.requests, args.concurrency, mode)
+            print(f"| {mode} | {r['rps']:.1f} | {r['p50']:.2f} | {r['p95']:.2f} | {r['elapsed']:.1f} | {r['errors']} |")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# TTS engine routing against local fake engines: time to audio under a healthy mix, a slow edge tail and an edge
+# outage, for the old strict edge -> gTTS -> OpenAI chain and for TtsRouter with and without hedging.
+#   python benchmarks/tts_router_sim.py --requests 300 --scale 0.1
+# --scale shrinks every fake latency (1.0 = realistic seconds) so a run takes seconds rather than minutes.
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from app import TtsRouter
+
+# engine -> (median seconds, slow-tail probability, tail seconds, failure probability, seconds before failing)
+SCENARIOS = {
+    "healthy": {"edge": (0.4, 0.02, 1.5, 0.0, 0), "gtts": (0.7, 0.02, 2.0, 0.0, 0), "openai": (1.2, 0.0, 0, 0.0, 0)},
+    "edge slow tail": {"edge": (0.4, 0.08, 4.0, 0.0, 0), "gtts": (0.7, 0.02, 2.0, 0.0, 0), "openai": (1.2, 0.0, 0, 0.0, 0)},
+    "edge outage": {"edge": (0.4, 0.0, 0, 1.0, 5.0), "gtts": (0.7, 0.02, 2.0, 0.0, 0), "openai": (1.2, 0.0, 0, 0.0, 0)},
+}
+
+
+class FakeEngine:
+    def __init__(self, profile, scale, rng):
+        self.median, self.tail_p, self.tail, self.fail_p, self.fail_after = profile
+        self.scale, self.rng = scale, rng
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text, language, voice):
+        with self._lock:
+            self.calls += 1
+            roll, jitter = self.rng.random(), self.rng.uniform(0.8, 1.25)
+        if roll < self.fail_p:
+            time.sleep(self.fail_after * self.scale)
+            return None
+        time.sleep((self.tail if roll < self.fail_p + self.tail_p else self.median * jitter) * self.scale)
+        return b"ID3" + text.encode()
+
+
+def strict_chain(engines):
+    # What text_to_speech did before the router: each engine in turn, waiting out every failure
+    def synthesize(text, language, accent=None):
+        for name, engine in engines.items():
+            audio = engine(text, language, name)
+            if audio: return name, name, audio
+        return None, None, None
+    return synthesize
+
+
+def run(synthesize, requests, concurrency):
+    latencies = []
+    def one(i):
+        start = time.perf_counter()
+        name, _, audio = synthesize(f"sentence {i}", "en")
+        latencies.append(time.perf_counter() - start if audio else float("inf"))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scale", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, latencies x{args.scale}; times below are rescaled to real seconds\n")
+    print("| scenario | routing | p50 (s) | p95 (s) | p99 (s) | failed | engine calls |")
+    print("|----------|---------|--------:|--------:|--------:|-------:|-------------:|")
+    for scenario, profiles in SCENARIOS.items():
+        for routing in ("strict order", "router", "router + hedge"):
+            rng = random.Random(42)
+            engines = {name: FakeEngine(profile, args.scale, rng) for name, profile in profiles.items()}
+            if routing == "strict order":
+                synthesize = strict_chain(engines)
+            else:
+                router = TtsRouter(50, routing.endswith("hedge"), 0.9, 0.25 * args.scale, 30)
+                for name, engine in engines.items():
+                    router.register(name, engine, lambda language, accent, name=name: name, profiles[name][0] * args.scale, hedgeable=name != "openai")
+                synthesize = router.synthesize
+            latencies = run(synthesize, args.requests, args.concurrency)
+            ok = [l for l in latencies if l != float("inf")]
+            pct = lambda q: ok[min(len(ok) - 1, int(q * len(ok)))] / args.scale if ok else float("nan")
+            calls = sum(engine.calls for engine in engines.values())
+            print(f"| {scenario} | {routing} | {pct(0.5):.2f} | {pct(0.95):.2f} | {pct(0.99):.2f} | {len(latencies) - len(ok)} | {calls} |", flush=True)
+
+
+if __name__ == "__main__":
+    main()
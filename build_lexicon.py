@@ -0,0 +1,142 @@
+# Builds the local English lexicon app.py reads (LEXICON_PATH, default data/lexicon.idx) from a Wiktextract dump:
+#   curl -O https://kaikki.org/dictionary/English/kaikki.org-dictionary-English.jsonl.gz
+#   python build_lexicon.py kaikki.org-dictionary-English.jsonl.gz --top 60000
+# --top keeps only the N most frequent English words (needs wordfreq); 0 keeps every headword.
+# Entries come out in the shape the LLM lookups return, so cards and concept graphs render them unchanged.
+import argparse
+import gzip
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAGIC = b"LEXICON1"
+HEADER = struct.Struct("<8sI")
+RECORD = struct.Struct("<IIII")  # key offset, key length, value offset, value length
+
+MAX_SYNONYMS = 8
+MAX_ANTONYMS = 6
+MAX_EXAMPLE_CHARS = 200
+MAX_ETYMOLOGY_CHARS = 300
+
+
+def key(word):
+    return ' '.join(word.split()).casefold()
+
+
+def words_of(items, limit, exclude):
+    out = []
+    for item in items or []:
+        word = item.get('word', '').strip() if isinstance(item, dict) else ''
+        if word and key(word) != exclude and word not in out: out.append(word)
+        if len(out) >= limit: break
+    return out
+
+
+def trim(text, limit):
+    # Whole sentences up to the limit where possible
+    text = ' '.join((text or '').split())
+    if len(text) <= limit: return text
+    cut = text.rfind('. ', 0, limit)
+    return text[:cut + 1] if cut > 0 else text[:limit].rsplit(' ', 1)[0] + "…"
+
+
+def merge(entry, record):
+    # Wiktextract has one record per (word, part of speech); the first record with a real sense wins each field,
+    # and synonyms/antonyms accumulate across them
+    word_key = key(record['word'])
+    senses = [s for s in record.get('senses', []) if s.get('glosses')]
+    # "plural of cat" style senses only count when a word has nothing better
+    senses.sort(key=lambda s: bool(s.get('form_of')) or 'form-of' in s.get('tags', []))
+    if senses and not entry.get('definition'):
+        entry['definition'] = senses[0]['glosses'][-1]
+        entry['form_of'] = bool(senses[0].get('form_of')) or 'form-of' in senses[0].get('tags', [])
+    elif senses and entry.get('form_of') and not (senses[0].get('form_of') or 'form-of' in senses[0].get('tags', [])):
+        entry['definition'], entry['form_of'] = senses[0]['glosses'][-1], False
+    if not entry.get('pronunciation'):
+        entry['pronunciation'] = next((s['ipa'] for s in record.get('sounds', []) if s.get('ipa')), "")
+    if not entry.get('example'):
+        examples = [e.get('text', '') for s in senses for e in s.get('examples', []) if 0 < len(e.get('text', '')) <= MAX_EXAMPLE_CHARS]
+        entry['example'] = ' '.join(examples[0].split()) if examples else ""
+    if not entry.get('etymology'):
+        entry['etymology'] = trim(record.get('etymology_text'), MAX_ETYMOLOGY_CHARS)
+    entry['synonyms'] = (entry['synonyms'] + [w for w in words_of(record.get('synonyms', []) + [x for s in senses for x in s.get('synonyms', [])], MAX_SYNONYMS, word_key) if w not in entry['synonyms']])[:MAX_SYNONYMS]
+    entry['antonyms'] = (entry['antonyms'] + [w for w in words_of(record.get('antonyms', []) + [x for s in senses for x in s.get('antonyms', [])], MAX_ANTONYMS, word_key) if w not in entry['antonyms']])[:MAX_ANTONYMS]
+
+
+def result_entry(word, entry):
+    return {
+        "word": word, "translated_word": None, "sentence_translation": None,
+        "pronunciation": entry['pronunciation'], "definition": entry['definition'], "translated_definition": "",
+        "example": entry['example'], "etymology": entry['etymology'], "related_words": [],
+        "synonyms": entry['synonyms'], "antonyms": entry['antonyms'], "language": "English",
+    }
+
+
+def read_dump(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip(): yield json.loads(line)
+
+
+def write_index(path, entries):
+    # entries: {key: entry dict}. Layout: header | records sorted by key bytes | key blob | value blob
+    keys = sorted(entries, key=lambda k: k.encode('utf-8'))
+    encoded_keys = [k.encode('utf-8') for k in keys]
+    values = [zlib.compress(json.dumps(entries[k], ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 9) for k in keys]
+    key_base = HEADER.size + RECORD.size * len(keys)
+    value_base = key_base + sum(len(k) for k in encoded_keys)
+    records, key_offset, value_offset = [], key_base, value_base
+    for k, v in zip(encoded_keys, values):
+        records.append(RECORD.pack(key_offset, len(k), value_offset, len(v)))
+        key_offset += len(k)
+        value_offset += len(v)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys)))
+        f.write(b"".join(records))
+        f.write(b"".join(encoded_keys))
+        f.write(b"".join(values))
+    os.replace(tmp_path, path)
+    return value_offset
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dump", help="Wiktextract JSONL (optionally .gz), e.g. kaikki.org-dictionary-English.jsonl.gz")
+    parser.add_argument("--out", default=os.getenv("LEXICON_PATH", os.path.join(ROOT, "data", "lexicon.idx")))
+    parser.add_argument("--top", type=int, default=60000, help="keep the N most frequent English words (0 = all)")
+    args = parser.parse_args()
+
+    allowed = None
+    if args.top:
+        from wordfreq import top_n_list
+        allowed = set(top_n_list('en', args.top))
+
+    start = time.perf_counter()
+    merged, headwords, records = {}, {}, 0
+    for record in read_dump(args.dump):
+        if record.get('lang_code') != 'en' or not record.get('word'): continue
+        records += 1
+        word_key = key(record['word'])
+        if allowed is not None and word_key not in allowed: continue
+        # Lower-case headwords win over capitalised ones ("bill" over "Bill") for the same key, senses included
+        if word_key not in headwords or (record['word'] == word_key and headwords[word_key] != word_key):
+            if word_key in headwords: merged.pop(word_key)
+            headwords[word_key] = record['word']
+        elif record['word'] != headwords[word_key]:
+            continue
+        merge(merged.setdefault(word_key, {"synonyms": [], "antonyms": []}), record)
+
+    entries = {k: result_entry(headwords[k], e) for k, e in merged.items() if e.get('definition')}
+    size = write_index(args.out, entries)
+    print(f"{records} English records, {len(entries)} entries written to {args.out} ({size / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
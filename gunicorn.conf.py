@@ -0,0 +1,33 @@
+# Gunicorn picks this file up automatically from the working directory, so `gunicorn app:app` in the procfile uses it.
+# SERVING_MODE=sync (default) keeps the classic one-request-per-worker model.
+# SERVING_MODE=async runs gevent workers: upstream calls (OpenRouter, Pexels, TTS) yield to each other cooperatively,
+# so one worker can hold hundreds of in-flight lookups. Per-upstream caps live in app.py (*_MAX_CONCURRENCY).
+import os
+
+SERVING_MODE = os.getenv("SERVING_MODE", "sync")
+
+if SERVING_MODE == "async":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("ASYNC_WORKER_CONNECTIONS", 1000))
+
+# LLM completions can legitimately take longer than gunicorn's 30s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 90))
+
+# Heavy engines (langid model, edge_tts, gtts, wordfreq; see PRELOAD_ENGINES in app.py) are loaded before traffic.
+# Sync mode preloads the app in the master so workers share the loaded modules copy-on-write and boot instantly.
+# Gevent workers must import the app after monkey-patching, so in async mode each worker warms up before it serves.
+preload_app = os.getenv("PRELOAD_APP", "0" if SERVING_MODE == "async" else "1") == "1"
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+        server.log.info("Boot report: %s", app.warm_engines())
+
+
+def post_worker_init(worker):
+    import app
+    # Admission control reserves workers for local endpoints and splits per-client rate limits across workers
+    app.ADMISSION.configure(worker.cfg.workers)
+    report = app.boot_report() if preload_app else app.warm_engines()
+    worker.log.info("Worker boot report: %s", report)
@@ -1,4 +1,4 @@
-let currentResults = [], activeResultIndex = 0, savedWords = JSON.parse(localStorage.getItem('offline_dictionary') || '[]'), recentSearches = JSON.parse(localStorage.getItem('recent_searches') || '[]'), chatHistory = [], selectedAccent = 'en-US', availableVoices = [], isRecording = false, isInitializing = false, network = null, mediaRecorder = null, recognition = null;
+let currentResults = [], activeResultIndex = 0, savedWords = JSON.parse(localStorage.getItem('offline_dictionary') || '[]'), recentSearches = JSON.parse(localStorage.getItem('recent_searches') || '[]'), chatSessionId = null, selectedAccent = 'en-US', availableVoices = [], isRecording = false, isInitializing = false, network = null, mediaRecorder = null, recognition = null;
 
 // Concise Language UI Dictionary
 const languageUI = {
@@ -11,7 +11,38 @@ const langCodeMap = { 'Hindi': 'hi', 'Marathi': 'mr', 'Bengali': 'bn', 'Telugu':
 
 const getEl = (id) => document.getElementById(id);
 const querySel = (sel) => document.querySelector(sel);
-const apiCall = async (endpoint, body) => (await fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) })).json();
+// Retries once after Retry-After when the server sheds load (503) or rate-limits this client (429)
+const apiCall = async (endpoint, body, retry = true) => {
+    const res = await fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) });
+    const wait = Number(res.headers.get('Retry-After'));
+    if (retry && (res.status === 503 || res.status === 429) && wait > 0 && wait <= 10) {
+        await new Promise(resolve => setTimeout(resolve, wait * 1000));
+        return apiCall(endpoint, body, false);
+    }
+    return res.json();
+};
+const READER_STREAM_THRESHOLD = 64 * 1024;
+const escapeHtml = (text) => String(text ?? '').replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+
+// POSTs to a text/event-stream endpoint and calls handlers[event](data) for every event as it arrives
+async function streamSSE(endpoint, body, handlers) {
+    const res = await fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) });
+    if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+    const reader = res.body.getReader(), decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let idx;
+        while ((idx = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, idx); buffer = buffer.slice(idx + 2);
+            const event = (block.match(/^event: (.*)$/m) || [])[1] || 'message';
+            const data = block.split('\n').filter(l => l.startsWith('data: ')).map(l => l.slice(6)).join('\n');
+            if (handlers[event]) handlers[event](data ? JSON.parse(data) : null);
+        }
+    }
+}
 
 document.addEventListener('DOMContentLoaded', () => {
     if (typeof lucide !== 'undefined') lucide.createIcons();
@@ -28,12 +59,13 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     getEl('search-input').addEventListener('input', (e) => getEl('clear-search-btn').style.display = e.target.value.trim() ? 'block' : 'none');
+    syncOfflinePack(); window.addEventListener('online', syncOfflinePack);
     if (localStorage.getItem('theme') === 'dark' || (!('theme' in localStorage) && window.matchMedia('(prefers-color-scheme: dark)').matches)) document.documentElement.classList.add('dark');
 });
 
 function loadVoices() { availableVoices = window.speechSynthesis.getVoices(); window.speechSynthesis.onvoiceschanged = () => availableVoices = window.speechSynthesis.getVoices(); }
 function updateAccent() { selectedAccent = getEl('accent-selector').value; }
-function toggleTheme() { document.documentElement.classList.toggle('dark'); localStorage.setItem('theme', document.documentElement.classList.contains('dark') ? 'dark' : 'light'); }
+function toggleTheme() { document.documentElement.classList.toggle('dark'); localStorage.setItem('theme', document.documentElement.classList.contains('dark') ? 'dark' : 'light'); if (network && graphSession) network.setOptions(graphOptions()); }
 
 function switchMode(mode) {
     document.querySelectorAll('.mode-btn').forEach(btn => btn.classList.remove('active'));
@@ -51,7 +83,7 @@ async function handleWotd() {
     try {
         const lang = getEl('language-selector').value;
         const theme = document.documentElement.classList.contains('dark') ? 'dark' : 'light';
-        const res = await fetch(`/api/wotd?language=${lang}&theme=${theme}`);
+        const res = await fetch(`/api/wotd?language=${encodeURIComponent(lang)}&theme=${theme}&compact=1`);
         const data = await res.json();
         
         currentResults = data.results; activeResultIndex = 0;
@@ -187,11 +219,12 @@ async function handleSearch() {
     try {
         const offline = savedWords.find(w => w.word.toLowerCase() === inp.toLowerCase());
         if (!navigator.onLine && offline) {
+            const entry = await packEntry(offline);
             currentResults = [offline]; activeResultIndex = 0; addToRecent(offline.word);
-            getEl('search-results').innerHTML = localizeHtml(offline.html || "<p>Offline view.</p>", lang);
+            getEl('search-results').innerHTML = localizeHtml((entry && entry.html) || offline.html || "<p>Offline view.</p>", lang);
         } else {
             // UPDATED ENDPOINT HERE: /api/dictionary -> /api/search
-            const data = await apiCall('/api/search', { term: inp, language: lang, theme: document.documentElement.classList.contains('dark') ? 'dark' : 'light' });
+            const data = await streamSearch({ term: inp, language: lang, theme: document.documentElement.classList.contains('dark') ? 'dark' : 'light', compact: 1 });
             currentResults = data.results; activeResultIndex = 0;
             const tabs = getEl('tabs-container');
             if (currentResults.length > 1) {
@@ -206,6 +239,29 @@ async function handleSearch() {
     finally { getEl('loading-indicator').classList.add('hidden'); getEl('search-results').classList.remove('hidden'); }
 }
 
+// Fills in a preview card field by field while the full result is still being generated
+async function streamSearch(body) {
+    let final = null, failure = null; const preview = {};
+    try {
+        await streamSSE('/api/search/stream', body, {
+            field: ({ index, field, value }) => { if (index === 0) { preview[field] = value; renderSearchPreview(preview); } },
+            done: (data) => { final = data; },
+            error: (data) => { failure = data.error; }
+        });
+    } catch (e) { console.error(e); }
+    if (final) return final;
+    if (failure) throw new Error(failure);
+    // GET so the browser can revalidate a repeat lookup with If-None-Match instead of re-downloading it
+    return (await fetch(`/api/search?${new URLSearchParams(body)}`)).json();
+}
+
+function renderSearchPreview(p) {
+    if (!p.word) return;
+    getEl('loading-indicator').classList.add('hidden'); getEl('search-results').classList.remove('hidden');
+    getEl('search-results').innerHTML = `<div class="bg-white dark:bg-slate-900 rounded-3xl p-8 shadow-xl border border-orange-100 dark:border-slate-800 lg:w-2/3"><h2 class="text-6xl font-bold text-slate-900 dark:text-white tracking-tight">${escapeHtml(p.translated_word || p.word)}</h2>${p.pronunciation ? `<div class="text-slate-500 font-mono text-lg mt-1">${escapeHtml(p.pronunciation)}</div>` : ''}<p class="text-xl text-slate-800 dark:text-slate-100 leading-relaxed font-medium mt-6">${escapeHtml(p.translated_definition || p.definition || '')}</p>${p.example ? `<p class="text-lg text-slate-600 dark:text-slate-300 italic mt-4">${escapeHtml(p.example)}</p>` : ''}<div class="flex items-center gap-2 text-slate-400 text-sm mt-6"><i data-lucide="loader-2" class="w-4 h-4 animate-spin"></i> Loading...</div></div>`;
+    if (typeof lucide !== 'undefined') lucide.createIcons();
+}
+
 function setActiveResult(index) {
     activeResultIndex = index; const lang = getEl('language-selector').value;
     document.querySelectorAll('.tab-btn').forEach((btn, i) => {
@@ -216,20 +272,27 @@ function setActiveResult(index) {
     if (!getEl('view-map').classList.contains('hidden')) renderConceptMap(currentResults[index]);
 }
 
+// Short texts are fetched with GET so the browser can reuse cached audio (ETag/Range); long ones fall back to POST
+async function playServerAudio(endpoint, params) {
+    const url = `${endpoint}?${new URLSearchParams(params)}`;
+    if (url.length <= 2000) return new Audio(url).play();
+    const res = await fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(params) });
+    if (!res.ok) throw new Error(`TTS failed: ${res.status}`);
+    return new Audio(URL.createObjectURL(await res.blob())).play();
+}
+
 async function pronounceWord(btn, word) { 
     if (btn) { var original = btn.innerHTML; btn.innerHTML = `<i data-lucide="loader-2" class="w-5 h-5 animate-spin"></i>`; if (typeof lucide !== 'undefined') lucide.createIcons(); }
     try {
-        const blob = await (await fetch('/api/pronounce', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ word: word, accent: selectedAccent }) })).blob();
-        new Audio(URL.createObjectURL(blob)).play();
-    } catch(e) { nativeSpeak(word); }
+        await playServerAudio('/api/pronounce', { word: word, accent: selectedAccent });
+    } catch(e) { if (!await playPackAudio(word)) nativeSpeak(word); }
     finally { if (btn) { setTimeout(() => { btn.innerHTML = original; if (typeof lucide !== 'undefined') lucide.createIcons(); }, 1000); } }
 }
 
 async function speakText(btn, text) {
     if (btn) { var original = btn.innerHTML; btn.innerHTML = `<i data-lucide="loader-2" class="w-3 h-3 animate-spin"></i>`; if (typeof lucide !== 'undefined') lucide.createIcons(); }
     try {
-        const blob = await (await fetch('/api/tts', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ text: text, accent: selectedAccent }) })).blob();
-        new Audio(URL.createObjectURL(blob)).play();
+        await playServerAudio('/api/tts', { text: text, accent: selectedAccent });
     } catch(e) { nativeSpeak(text); }
     finally { if (btn) { setTimeout(() => { btn.innerHTML = original; if (typeof lucide !== 'undefined') lucide.createIcons(); }, 1000); } }
 }
@@ -246,13 +309,33 @@ async function handleChat(e) {
     e.preventDefault(); const msg = getEl('chat-input').value; if (!msg.trim()) return;
     const con = getEl('chat-history');
     con.innerHTML += `<div class="flex justify-end mb-4"><div class="bg-orange-600 text-white px-5 py-3 rounded-2xl rounded-tr-none max-w-[80%] shadow-md">${msg}</div></div>`;
-    chatHistory.push({ role: 'user', text: msg }); getEl('chat-input').value = '';
+    getEl('chat-input').value = '';
     const lid = 'load-'+Date.now();
     con.innerHTML += `<div id="${lid}" class="flex gap-3 mb-4"><div class="w-8 h-8 rounded-full bg-orange-100 dark:bg-slate-800 flex items-center justify-center text-orange-600"><i data-lucide="ghost" class="w-5 h-5 animate-pulse"></i></div><div class="bg-slate-50 dark:bg-slate-800 p-4 rounded-2xl rounded-tl-none text-slate-500">Thinking...</div></div>`;
     if (typeof lucide !== 'undefined') lucide.createIcons();
     try {
-        const data = await apiCall('/api/chat', { message: msg, history: chatHistory });
-        getEl(lid).remove(); chatHistory.push({ role: 'assistant', text: data.response });
+        let data = null, text = '', failure = null;
+        const bubble = getEl(lid).querySelector('.rounded-tl-none');
+        try {
+            await streamSSE('/api/chat/stream', { message: msg, session_id: chatSessionId }, {
+                token: ({ text: t }) => { text += t; bubble.textContent = text; con.scrollTop = con.scrollHeight; },
+                done: (d) => { data = d; },
+                error: (d) => { throw new Error(d.error); }
+            });
+        } catch (err) { console.error(err); failure = err; }
+        // Once tokens have arrived the reply is already paid for: keep the partial text and say it broke off rather
+        // than ask /api/chat for a second completion
+        if (!data && text) {
+            const note = document.createElement('p');
+            note.className = 'text-red-500 text-sm mt-2';
+            note.textContent = `Reply interrupted${failure && failure.message ? `: ${failure.message}` : ''}`;
+            bubble.appendChild(note);
+            getEl(lid).querySelector('.animate-pulse')?.classList.remove('animate-pulse');
+            getEl(lid).removeAttribute('id');
+            return;
+        }
+        if (!data) data = await apiCall('/api/chat', { message: msg, session_id: chatSessionId });
+        getEl(lid).remove(); chatSessionId = data.session_id || chatSessionId;
         con.insertAdjacentHTML('beforeend', data.html); makeInteractive('chat-history');
         if (typeof lucide !== 'undefined') lucide.createIcons(); con.scrollTop = con.scrollHeight;
     } catch(e) { console.error(e); }
@@ -290,18 +373,26 @@ async function analyzeReaderParagraph() {
     const card = getEl('reader-definition-card'); card.innerHTML = '<div class="flex justify-center mt-10"><i data-lucide="loader-2" class="animate-spin text-orange-600"></i></div>';
     if (typeof lucide !== 'undefined') lucide.createIcons();
     try {
-        const data = await apiCall('/api/analyze', { text: text, language: getEl('language-selector').value });
+        const data = await readerCall('/api/analyze', { text: text, language: getEl('language-selector').value });
         card.innerHTML = `<div class="flex flex-col h-full"><h3 class="text-xl font-bold dark:text-white mb-4 sticky top-0 bg-white dark:bg-slate-900 py-2 border-b border-slate-100 dark:border-slate-800">Text Analysis</h3><div class="overflow-y-auto scrollbar-thin flex-1 pr-2" id="analysis-content">${data.html}</div><button onclick="resetReaderCard()" class="text-orange-600 text-sm font-bold flex items-center gap-1 hover:underline mt-auto pt-4 border-t border-slate-100 dark:border-slate-800">Back <i data-lucide="arrow-left" class="w-3 h-3"></i></button></div>`;
         makeInteractive('analysis-content'); if (typeof lucide !== 'undefined') lucide.createIcons();
     } catch (e) { card.innerHTML = '<p class="text-center mt-10 text-slate-400">Analysis failed.</p>'; }
 }
 
+// Long texts are worked through a limited number of paragraphs per request; asking again picks up the deferred ones
+// (the rest now come from the server's cache) for as long as each request gets something new done
+async function readerCall(endpoint, body) {
+    let data = await apiCall(endpoint, body);
+    while (data.deferred && data.asked) data = await apiCall(endpoint, body);
+    return data;
+}
+
 async function fixGrammar() {
     const text = getEl('reader-input').value; if (!text.trim()) return;
     const card = getEl('reader-definition-card'); card.innerHTML = '<div class="flex justify-center mt-10"><i data-lucide="loader-2" class="animate-spin text-orange-600"></i></div>';
     if (typeof lucide !== 'undefined') lucide.createIcons();
     try {
-        const data = await apiCall('/api/fix_grammar', { text: text });
+        const data = await readerCall('/api/fix_grammar', { text: text });
         const safeText = data.corrected_text.replace(/'/g, "\\'").replace(/"/g, '&quot;');
         card.innerHTML = `<div class="flex flex-col h-full"><h3 class="text-xl font-bold dark:text-white mb-4 sticky top-0 bg-white dark:bg-slate-900 py-2 border-b border-slate-100 dark:border-slate-800 flex items-center gap-2"><i data-lucide="check-circle-2" class="w-5 h-5 text-emerald-500"></i> Grammar Check</h3><div class="overflow-y-auto scrollbar-thin flex-1 pr-2"><p class="text-lg text-slate-800 dark:text-slate-200 leading-relaxed font-medium bg-emerald-50 dark:bg-emerald-900/10 p-4 rounded-xl border border-emerald-100 dark:border-emerald-900/30">${data.corrected_text}</p></div><div class="mt-auto pt-4 border-t border-slate-100 dark:border-slate-800 flex gap-3"><button onclick="applyGrammarFix('${safeText}')" class="flex-1 bg-emerald-600 text-white py-2 rounded-xl font-bold hover:bg-emerald-700 transition-colors shadow-lg shadow-emerald-600/20">Apply Fix</button><button onclick="resetReaderCard()" class="px-4 py-2 text-slate-500 hover:bg-slate-100 dark:hover:bg-slate-800 rounded-xl font-medium transition-colors">Cancel</button></div></div>`;
         if (typeof lucide !== 'undefined') lucide.createIcons();
@@ -316,7 +407,22 @@ async function toggleReaderMode() {
     else {
         const text = input.value; if (!text.trim()) return;
         try {
-            const data = await apiCall('/api/reader_format', { text: text });
+            if (text.length > READER_STREAM_THRESHOLD) {
+                // Long documents come back as NDJSON chunks of markup; show the first pages while the rest arrives
+                display.innerHTML = ''; input.classList.add('hidden'); display.classList.remove('hidden'); btn.textContent = "Edit Text"; resetReaderCard();
+                const res = await fetch('/api/reader_format', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ text: text, stream: true, compact: true }) });
+                const reader = res.body.getReader(), decoder = new TextDecoder(); let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    const lines = buffer.split('\n'); buffer = lines.pop();
+                    lines.filter(l => l.trim()).forEach(l => display.insertAdjacentHTML('beforeend', JSON.parse(l).html));
+                    if (done) break;
+                }
+                if (buffer.trim()) display.insertAdjacentHTML('beforeend', JSON.parse(buffer).html);
+                return;
+            }
+            const data = await apiCall('/api/reader_format', { text: text, compact: true });
             display.innerHTML = data.html; input.classList.add('hidden'); display.classList.remove('hidden'); btn.textContent = "Edit Text"; resetReaderCard();
         } catch(e) { console.error("Format error", e); }
     }
@@ -328,26 +434,101 @@ function resetReaderCard() {
 }
 
 async function defineWord(word) { getEl('search-input').value = word.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g,""); getEl('clear-search-btn').style.display = 'block'; handleSearch(); switchMode('search'); }
-function speakReaderText() { speakText(null, getEl('reader-input').value); }
+// Reader passages use the streaming endpoint; MediaSource lets long POSTed texts start playing before synthesis finishes
+async function playStreamingAudio(params) {
+    const url = `/api/tts/stream?${new URLSearchParams(params)}`;
+    if (url.length <= 2000) return new Audio(url).play();
+    if (!window.MediaSource || !MediaSource.isTypeSupported('audio/mpeg')) return playServerAudio('/api/tts/stream', params);
+    const res = await fetch('/api/tts/stream', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(params) });
+    if (!res.ok || !res.body) throw new Error(`TTS failed: ${res.status}`);
+    const source = new MediaSource(), audio = new Audio(URL.createObjectURL(source));
+    source.addEventListener('sourceopen', async () => {
+        const buffer = source.addSourceBuffer('audio/mpeg'), reader = res.body.getReader();
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer.appendBuffer(value); await new Promise(r => buffer.addEventListener('updateend', r, { once: true }));
+        }
+        source.endOfStream();
+    }, { once: true });
+    return audio.play();
+}
+
+async function speakReaderText() {
+    const text = getEl('reader-input').value; if (!text.trim()) return;
+    try { await playStreamingAudio({ text: text, accent: selectedAccent }); } catch(e) { nativeSpeak(text); }
+}
+
+// Concept map: /api/graph keeps the graph server-side. Double-click expands a node (only new nodes/edges come back);
+// double-clicking a node that is already expanded opens its definition. Styles arrive once per session for both themes.
+let graphSession = null;
+const currentTheme = () => document.documentElement.classList.contains('dark') ? 'dark' : 'light';
 
-function renderConceptMap(data) {
-    if (!data || !data.graph) return;
+function graphOptions() {
+    const styles = graphSession.styles[currentTheme()];
+    return { groups: styles.groups, edges: { color: { color: styles.edge_color } }, physics: { stabilization: false, barnesHut: { gravitationalConstant: -3000 } } };
+}
+
+function addGraphDelta(delta) {
+    graphSession.nodes.update(delta.nodes.map(n => ({ id: n.id, label: n.label, group: n.group })));
+    graphSession.edges.update(delta.edges.map(e => ({ id: `${e.from}-${e.to}`, from: e.from, to: e.to, dashes: e.dashes })));
+    delta.expanded.forEach(id => graphSession.expanded.add(id));
+}
+
+async function expandGraphNode(id) {
+    if (!graphSession || graphSession.busy) return;
+    if (graphSession.expanded.has(id)) return defineWord(graphSession.nodes.get(id).label);
+    graphSession.busy = true;
+    try {
+        const res = await fetch('/api/graph', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ session_id: graphSession.id, expand: id, depth: 1 }) });
+        const delta = await res.json();
+        if (delta.expired) { const word = graphSession.word; graphSession = null; return renderConceptMap({ word: word }); }
+        if (!res.ok) throw new Error(delta.error);
+        addGraphDelta(delta);
+    } catch (e) { console.error(e); }
+    finally { if (graphSession) graphSession.busy = false; }
+}
+
+async function renderConceptMap(data) {
+    if (!data || !data.word) return;
     getEl('map-placeholder').classList.add('hidden');
+    if (typeof vis === 'undefined') return;
+    const lang = getEl('language-selector').value;
+    if (graphSession && graphSession.word === data.word && graphSession.lang === lang) return network.setOptions(graphOptions());
+    try {
+        const res = await fetch('/api/graph', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ word: data.word, language: lang, depth: 1 }) });
+        const first = await res.json();
+        if (!res.ok) throw new Error(first.error);
+        graphSession = { id: first.session_id, word: data.word, lang: lang, styles: first.styles, nodes: new vis.DataSet(), edges: new vis.DataSet(), expanded: new Set(), busy: false };
+        addGraphDelta(first);
+    } catch (e) { console.error(e); graphSession = null; return renderStaticConceptMap(data); }
+    if (network) network.destroy();
+    network = new vis.Network(getEl('concept-network'), { nodes: graphSession.nodes, edges: graphSession.edges }, graphOptions());
+    network.on("click", p => { if (p.nodes.length > 0) pronounceWord(null, graphSession.nodes.get(p.nodes[0]).label); });
+    network.on("doubleClick", p => { if (p.nodes.length > 0) expandGraphNode(p.nodes[0]); });
+}
+
+function renderStaticConceptMap(data) {
+    // One-hop graph from the search response, for when /api/graph is unavailable
+    if (!data.graph) return;
     const nodes = data.graph.nodes.filter(n => n.group !== 'related').map(n => ({ id: n.id, label: n.label, color: { background: n.group === 'main' ? '#ea580c' : (n.group === 'synonym' ? '#10b981' : '#ef4444'), border: n.group === 'main' ? '#ea580c' : (n.group === 'synonym' ? '#10b981' : '#ef4444') }, font: { color: 'white', size: n.group === 'main' ? 24 : 16 }, shape: n.group === 'main' ? 'box' : 'dot', margin: 10 }));
-    const edges = data.graph.edges.filter(e => { const ids = new Set(nodes.map(n => n.id)); return ids.has(e.from) && ids.has(e.to); }).map(e => ({ from: e.from, to: e.to, color: { color: document.documentElement.classList.contains('dark') ? '#475569' : '#cbd5e1' }, dashes: e.dashes }));
-    if (typeof vis !== 'undefined') {
-        if (network) network.destroy();
-        network = new vis.Network(getEl('concept-network'), { nodes: new vis.DataSet(nodes), edges: new vis.DataSet(edges) }, { physics: { stabilization: false, barnesHut: { gravitationalConstant: -3000 } } });
-        network.on("click", p => { if (p.nodes.length > 0) pronounceWord(null, nodes.find(n => n.id === p.nodes[0]).label); });
-        network.on("doubleClick", p => { if (p.nodes.length > 0) defineWord(nodes.find(n => n.id === p.nodes[0]).label); });
-    }
+    const ids = new Set(nodes.map(n => n.id));
+    const edges = data.graph.edges.filter(e => ids.has(e.from) && ids.has(e.to)).map(e => ({ from: e.from, to: e.to, color: { color: document.documentElement.classList.contains('dark') ? '#475569' : '#cbd5e1' }, dashes: e.dashes }));
+    if (network) network.destroy();
+    network = new vis.Network(getEl('concept-network'), { nodes: new vis.DataSet(nodes), edges: new vis.DataSet(edges) }, { physics: { stabilization: false, barnesHut: { gravitationalConstant: -3000 } } });
+    network.on("click", p => { if (p.nodes.length > 0) pronounceWord(null, nodes.find(n => n.id === p.nodes[0]).label); });
+    network.on("doubleClick", p => { if (p.nodes.length > 0) defineWord(nodes.find(n => n.id === p.nodes[0]).label); });
 }
 
 function makeInteractive(id) {
     const el = getEl(id); if (!el) return;
-    el.querySelectorAll('.interactive-text').forEach(e => e.innerHTML = e.innerText.split(/(\s+)/).map(p => { const c = p.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()?"']/g, ""); return c ? `<span class="cursor-pointer hover:bg-orange-100 dark:hover:bg-orange-900/50 rounded transition-colors" onclick="defineWord('${c}')">${p}</span>` : p; }).join(''));
+    // Server-rendered text already carries .w spans; only tokenize what arrived as plain text
+    el.querySelectorAll('.interactive-text').forEach(e => { if (e.querySelector('.w')) return; e.innerHTML = e.innerText.split(/(\s+)/).map(p => { const c = p.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()?"']/g, ""); return c ? `<span class="w" data-w="${escapeHtml(c)}">${escapeHtml(p)}</span>` : p; }).join(''); });
 }
 
+// One listener for every tokenized word (.w spans from the server or makeInteractive)
+document.addEventListener('click', e => { const w = e.target.closest('.w'); if (w) defineWord(w.dataset.w); });
+
 function updateSaveIcons() {
     document.querySelectorAll('.save-btn').forEach(btn => {
         const exists = savedWords.some(w => w.word === btn.getAttribute('data-word'));
@@ -361,7 +542,7 @@ function toggleSave(btn, word) {
     const idx = savedWords.findIndex(w => w.word === word);
     if (idx !== -1) { savedWords.splice(idx, 1); if(!getEl('view-offline').classList.contains('hidden')) renderOfflineLib(); } 
     else { const d = currentResults.find(r => r.word === word); if (d) savedWords.push({ ...d, savedAt: Date.now() }); }
-    localStorage.setItem('offline_dictionary', JSON.stringify(savedWords)); updateSaveIcons();
+    localStorage.setItem('offline_dictionary', JSON.stringify(savedWords)); updateSaveIcons(); syncOfflinePack();
 }
 
 function renderOfflineLib() {
@@ -371,7 +552,76 @@ function renderOfflineLib() {
     if (typeof lucide !== 'undefined') lucide.createIcons();
 }
 
-function loadSavedWord(word) {
+async function loadSavedWord(word) {
     const wData = savedWords.find(w => w.word === word);
-    if (wData) { currentResults = [wData]; addToRecent(wData.word); switchMode('search'); getEl('search-results').innerHTML = wData.html; updateSaveIcons(); if (typeof lucide !== 'undefined') lucide.createIcons(); }
+    const entry = wData && !navigator.onLine ? await packEntry(wData) : null;
+    if (wData) { currentResults = [wData]; addToRecent(wData.word); switchMode('search'); getEl('search-results').innerHTML = (entry && entry.html) || wData.html; updateSaveIcons(); if (typeof lucide !== 'undefined') lucide.createIcons(); }
+}
+
+// Offline study packs: each saved word's card (thumbnails inlined) and pronunciation audio, kept in Cache Storage.
+// offline_pack_manifest maps entry key -> {hash, language, spoken}; syncs send the hashes so only changed entries come back
+// Words go in batches no larger than the server takes (it says so in a 400); it builds a limited number of entries per
+// request and hands the rest back as pending, which are asked for again while requests keep making progress
+let packManifest = JSON.parse(localStorage.getItem('offline_pack_manifest') || '{}'), packSyncing = null, packBatchWords = 100;
+// Same string as pack_key in app.py (lower-cased, not casefolded)
+const packKey = (word, language) => `${(language || 'English').trim().split(/\s+/).join(' ').toLowerCase()}|${word.trim().split(/\s+/).join(' ').toLowerCase()}`;
+const packUrl = (key) => `/offline-pack/${encodeURIComponent(key)}`;
+
+async function packEntry(saved) {
+    if (typeof caches === 'undefined') return null;
+    const res = await caches.match(packUrl(packKey(saved.word, saved.language)));
+    return res ? res.json() : null;
+}
+
+async function playPackAudio(word) {
+    const key = Object.keys(packManifest).find(k => packManifest[k].spoken === word);
+    const entry = key && typeof caches !== 'undefined' ? await caches.match(packUrl(key)).then(res => res && res.json()) : null;
+    if (!entry || !entry.audio) return false;
+    await new Audio(entry.audio).play();
+    return true;
+}
+
+async function syncOfflinePack() {
+    // Syncs run one at a time; a save during a sync waits for it and then syncs again
+    if (packSyncing) return packSyncing.then(() => syncOfflinePack());
+    if (!navigator.onLine || typeof caches === 'undefined') return;
+    packSyncing = (async () => {
+        const store = await caches.open('offline-pack'), byLanguage = {}, kept = new Set(), failed = new Set();
+        savedWords.forEach(w => (byLanguage[w.language || 'English'] = byLanguage[w.language || 'English'] || []).push(w.word));
+        for (const [language, words] of Object.entries(byLanguage)) {
+            try {
+                const queue = words.slice();
+                while (queue.length) {
+                    const batch = queue.splice(0, packBatchWords);
+                    const have = Object.fromEntries(batch.map(w => packKey(w, language)).filter(k => packManifest[k]).map(k => [k, packManifest[k].hash]));
+                    const data = await apiCall('/api/offline_pack', { words: batch, language, accent: selectedAccent, have });
+                    if (!data.entries && data.max_words && data.max_words < batch.length) { packBatchWords = data.max_words; queue.unshift(...batch); continue; }
+                    if (!data.entries) throw new Error(data.error || 'no pack');
+                    await storePackEntries(store, data.entries, language, kept);
+                    data.unchanged.forEach(k => kept.add(k));
+                    // Words the server could not look up or build this time keep whatever entry they already had
+                    data.missing.concat(data.pending).forEach(w => kept.add(packKey(w, language)));
+                    if (data.pending.length < batch.length) queue.push(...data.pending);
+                }
+            } catch (e) { failed.add(language); console.warn('Offline pack sync failed:', e); }
+        }
+        // Unsaved words leave the pack; a language whose sync failed keeps what it had
+        for (const [key, m] of Object.entries(packManifest)) {
+            if (!kept.has(key) && !failed.has(m.language)) { await store.delete(packUrl(key)); delete packManifest[key]; }
+        }
+        localStorage.setItem('offline_pack_manifest', JSON.stringify(packManifest));
+        localStorage.setItem('offline_dictionary', JSON.stringify(savedWords));
+    })().finally(() => { packSyncing = null; });
+    return packSyncing;
+}
+
+async function storePackEntries(store, entries, language, kept) {
+    for (const e of entries) {
+        await store.put(packUrl(e.key), new Response(JSON.stringify(e), { headers: { 'Content-Type': 'application/json' } }));
+        packManifest[e.key] = { hash: e.hash, language, spoken: e.spoken };
+        // Words saved before compact results carried their definition
+        const saved = savedWords.find(w => packKey(w.word, language) === e.key);
+        if (saved && !saved.definition) saved.definition = e.result.definition;
+        kept.add(e.key);
+    }
 }
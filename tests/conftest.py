@@ -0,0 +1,33 @@
+# app reads its configuration at import, so point it at a scratch cache and keep admission control out of the way
+# before any test imports it
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="app-tests-"))
+os.environ.setdefault("ADMISSION_CONTROL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def entry(word):
+    return {"word": word, "translated_word": None, "sentence_translation": None, "pronunciation": "/x/", "definition": f"{word} def", "translated_definition": None,
+            "example": f"A {word}.", "etymology": "Old", "related_words": [], "synonyms": [], "antonyms": [], "language": "English"}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    # Fresh lookup cache, no image fetches, and an LLM stub that records the terms of each call
+    import app
+    calls = []
+    def query_openrouter(messages, model=None, schema=None):
+        terms = [t.strip() for t in messages[-1]["content"].removeprefix("Define: ").split(",")]
+        calls.append(terms)
+        return {"choices": [{"message": {"content": json.dumps({"results": [entry(t) for t in terms]})}}]}
+    monkeypatch.setattr(app, "LOOKUP_CACHE", app.TieredCache(f"lookups-{uuid.uuid4().hex}", 3600, 64, 1 << 20))
+    monkeypatch.setattr(app, "query_openrouter", query_openrouter)
+    monkeypatch.setattr(app, "fetch_images_for", lambda queries, deadline=None: {})
+    return calls
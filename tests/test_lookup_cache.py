@@ -0,0 +1,44 @@
+import app
+
+
+def search(term):
+    with app.app.test_client().post("/api/search", json={"term": term, "language": "English"}) as r:
+        assert r.status_code == 200
+        return r.get_json()["results"]
+
+
+def batch(terms):
+    with app.app.test_client().post("/api/search/batch", json={"terms": terms, "language": "English"}) as r:
+        assert r.status_code == 200
+        return r.get_data(as_text=True)
+
+
+def test_search_then_batch_asks_only_for_new_words(llm):
+    search("cat")
+    assert batch(["cat", "dog"]).count("event: result") == 2
+    assert llm == [["cat"], ["dog"]]
+
+
+def test_batch_then_search_is_a_cache_hit(llm):
+    batch(["cat", "dog"])
+    assert search("dog")[0]["word"] == "dog"
+    assert llm == [["cat", "dog"]]
+
+
+def test_batch_results_serve_later_single_searches(llm, monkeypatch):
+    def no_stream(*args, **kwargs):
+        raise AssertionError("streamed lookup for a word the batch cached")
+    monkeypatch.setattr(app, "query_openrouter_stream", no_stream)
+    batch(["cat", "dog"])
+    assert search("cat")[0]["word"] == "cat"
+    with app.app.test_client().post("/api/search/stream", json={"term": "dog", "language": "English"}) as r:
+        body = r.get_data(as_text=True)
+    assert "event: done" in body and "event: error" not in body
+    assert llm == [["cat", "dog"]]
+
+
+def test_phrase_from_word_list_is_asked_again_by_search(llm):
+    batch(["good morning"])
+    search("good morning")
+    search("good morning")
+    assert llm == [["good morning"], ["good morning"]]
@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def pack(llm, monkeypatch):
+    # Fresh pack cache and no image search; audio comes from the list the test sets, one value per build
+    monkeypatch.setattr(app, "PACK_ENTRIES", app.TieredCache(f"packs-{uuid.uuid4().hex}", 3600, 64, 1 << 20))
+    monkeypatch.setattr(app, "get_cached_images", lambda query: [])
+    audio = []
+    monkeypatch.setattr(app, "pack_audio", lambda text, accent: audio.pop(0) if audio else b"mp3")
+    def request(words):
+        with app.app.test_client().post("/api/offline_pack", json={"words": words, "language": "English"}) as r:
+            assert r.status_code == 200
+            return r.get_json()
+    request.audio = audio
+    return request
+
+
+def test_pack_uses_words_looked_up_by_search(llm, pack):
+    with app.app.test_client().post("/api/search", json={"term": "bird", "language": "English"}) as r:
+        assert r.status_code == 200
+    data = pack(["bird"])
+    assert [entry["key"] for entry in data["entries"]] == ["english|bird"]
+    assert llm == [["bird"]]
+
+
+def test_entry_missing_audio_is_rebuilt(pack):
+    pack.audio.append(None)
+    first = pack(["owl"])["entries"][0]
+    assert first["audio"] is None and first["incomplete"] == ["audio"]
+    second = pack(["owl"])["entries"][0]
+    assert second["audio"] and "incomplete" not in second
+    assert pack(["owl"])["entries"][0]["hash"] == second["hash"]
+
+
+def test_pack_key_matches_client_normalization():
+    assert app.pack_key("  Straße ", "German") == "german|straße"
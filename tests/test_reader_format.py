@@ -0,0 +1,14 @@
+import app
+
+
+def reader_format(body):
+    with app.app.test_client().post("/api/reader_format", json=body) as r:
+        assert r.status_code == 200
+        return r.get_json()["html"]
+
+
+def test_markup_is_compact_only_when_asked():
+    text = "The cat sat."
+    assert reader_format({"text": text}) == app.process_interactive_text(text)
+    assert reader_format({"text": text, "compact": True}) == app.process_interactive_text(text, compact=True)
+    assert 'data-w="cat"' in reader_format({"text": text, "compact": True})
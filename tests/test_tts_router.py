@@ -0,0 +1,29 @@
+from app import TtsRouter
+
+
+def make_router():
+    router = TtsRouter(window=20, hedge=False, hedge_percentile=95, hedge_min_delay=0.1, timeout=5, max_age=3600)
+    audio = lambda text, language, voice: b"mp3"
+    router.register("edge", audio, lambda language, accent: "voice", 0.8)
+    router.register("gtts", audio, lambda language, accent: language, 1.2)
+    router.register("openai", audio, lambda language, accent: "nova", 2.0, hedgeable=False)
+    return router
+
+
+def test_paid_engine_ranks_after_slow_free_engines():
+    router = make_router()
+    for _ in range(5):
+        router.record("gtts", "en", 2.5, True)
+        router.record("edge", "hi", 3.0, True)
+        router.record("gtts", "hi", 2.2, True)
+    assert [name for name, _ in router.rank("en")] == ["edge", "gtts", "openai"]
+    assert [name for name, _ in router.rank("hi")] == ["gtts", "edge", "openai"]
+
+
+def test_paid_engine_runs_once_free_circuits_open():
+    router = make_router()
+    for _ in range(10):
+        router.record("edge", "en", 0.1, False)
+        router.record("gtts", "en", 0.1, False)
+    assert [name for name, _ in router.rank("en")] == ["openai"]
+    assert router.synthesize("hello", "en")[0] == "openai"
@@ -0,0 +1,35 @@
+import requests
+from urllib3.exceptions import MaxRetryError, NameResolutionError, NewConnectionError, ProtocolError
+
+import app
+
+
+def wrapped(reason):
+    return requests.ConnectionError(MaxRetryError(None, "/api", reason))
+
+
+def test_connection_never_made_is_safe_to_retry():
+    assert app._never_sent(requests.ConnectTimeout())
+    assert app._never_sent(wrapped(NewConnectionError(None, "Connection refused")))
+    assert app._never_sent(wrapped(NameResolutionError("example.invalid", None, OSError("Name or service not known"))))
+    assert app._never_sent(requests.ConnectionError(NewConnectionError(None, "Connection refused")))
+
+
+def test_broken_connection_may_have_been_sent():
+    assert not app._never_sent(requests.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError())))
+    assert not app._never_sent(requests.ReadTimeout())
+    assert not app._never_sent(requests.ConnectionError())
+
+
+def test_refused_post_is_retried(monkeypatch):
+    client = app.UpstreamClient("test", read_timeout=1, max_concurrency=2, retries=2, backoff=0)
+    attempts = []
+    def refuse(method, url, **kwargs):
+        attempts.append(method)
+        raise wrapped(NewConnectionError(None, "Connection refused"))
+    monkeypatch.setattr(client.session, "request", refuse)
+    try:
+        client.post("http://127.0.0.1:9/api")
+    except requests.ConnectionError:
+        pass
+    assert len(attempts) == 3
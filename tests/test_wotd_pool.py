@@ -0,0 +1,23 @@
+import os
+
+import app
+from conftest import entry
+
+
+def test_pooled_words_are_served_without_rendering(llm, monkeypatch):
+    pool = app.WotdPool(8, 3, [])
+    pool._pid = os.getpid()  # no refill thread; the test refills by hand
+    monkeypatch.setattr(app, "WOTD_POOL", pool)
+    monkeypatch.setattr(app, "wotd_candidates", lambda: ["cat", "dog"])
+    monkeypatch.setattr(app, "lookup_term", lambda term, language, prompt: {"results": []})
+    pool._refill("English", 2)
+    assert llm == [["cat", "dog"]] or llm == [["dog", "cat"]]
+
+    def no_render(*args, **kwargs):
+        raise AssertionError("pooled word rendered per request")
+    monkeypatch.setattr(app, "render_lookup_results", no_render)
+    with app.app.test_client().get("/api/wotd?language=English&theme=dark&mode=random") as r:
+        assert r.status_code == 200
+        item = r.get_json()["results"][0]
+    assert item["word"] in ("cat", "dog") and item["html"]
+    assert item["graph"] == app.build_concept_graph(entry(item["word"]), "dark")